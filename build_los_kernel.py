@@ -0,0 +1,32 @@
+"""
+Ahead-of-time compile the LOS kernels into the los_kernel_aot extension module.
+
+Importing the compiled module skips Numba JIT compilation (and the Numba
+import itself) in every worker process. Run once after installing:
+
+    python build_los_kernel.py
+
+Numba's AOT compiler does not support parallel=True, so the exported
+los_batch runs serially. main.py prefers the parallel JIT version when Numba
+is available and only falls back to this one without it.
+"""
+
+import os
+from numba.pycc import CC
+
+import los_kernel
+
+cc = CC("los_kernel_aot")
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+cc.export("haversine_km", "f8(f8, f8, f8, f8)")(los_kernel.haversine_km.py_func)
+cc.export("any_blocker", "b1(f4[:], f8, f8, f8)")(los_kernel.any_blocker.py_func)
+cc.export(
+    "los_batch",
+    "void(f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], f4[:, :], f8, f8, f8, b1[:])",
+)(los_kernel.los_batch.py_func)
+
+
+if __name__ == "__main__":
+    cc.compile()
+    print(f"Built los_kernel_aot in {cc.output_dir}")
@@ -2,7 +2,7 @@
 Line-of-sight calculator class for analyzing visibility between two peaks.
 
 This module accounts for Earth's curvature with standard atmospheric refraction (k=4/3).
-It uses cached elevation data (no external API calls).
+It uses the cached elevation grid (no external API calls).
 
 Example usage:
     peak1 = {
@@ -27,29 +27,72 @@ Example usage:
     calculator.generate_elevation_profile()
 """
 
-import json
+import hashlib
 import os
 import numpy as np
 import numpy.typing as npt
-import matplotlib.pyplot as plt
-from geopy.distance import geodesic
-from typing import Optional, Dict, List
-
-from peak import Peak
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from typing import Optional
+
+import geodesy
+from elevation_grid import ElevationGrid
+from geodesy import R_EARTH_KM, REFRACTION_FACTOR
+from peak import Peak, Peaks
+
+try:
+    # Ahead-of-time build from build_los_kernel.py, avoids JIT warmup per worker
+    from los_kernel_aot import any_blocker, haversine_km
+except ImportError:
+    try:
+        from los_kernel import any_blocker, haversine_km
+    except ImportError:
+        any_blocker = None
+        haversine_km = geodesy.haversine_km
+
+matplotlib.style.use("seaborn-v0_8")
+
+# Figure reused for every elevation profile rendered in this process
+_PROFILE_FIGURE = None
+_PROFILE_AXES = None
+
+
+def _get_profile_axes():
+    """Get the per-process profile figure and axes, creating them on first use."""
+    global _PROFILE_FIGURE, _PROFILE_AXES
+    if _PROFILE_FIGURE is None:
+        # Drawn directly on an Agg canvas, bypassing pyplot's figure manager
+        _PROFILE_FIGURE = Figure(figsize=(12, 6))
+        FigureCanvasAgg(_PROFILE_FIGURE)
+        _PROFILE_AXES = _PROFILE_FIGURE.add_subplot()
+    return _PROFILE_FIGURE, _PROFILE_AXES
 
 
 class LOSCalculator:
     """Calculate line-of-sight between two peaks accounting for Earth's curvature."""
 
-    R_EARTH_KM = 6371.0
-    REFRACTION_FACTOR = 4.0 / 3.0
+    PROFILE_DIR = "elevation_profiles"
     NUM_SAMPLES = 200
+    # Fractions along the path for each sample. Lat/lon are sampled with the
+    # float64 values, computed as k / (NUM_SAMPLES - 1) like los_kernel, so every
+    # path picks the same grid cells. The float32 copy and the Earth bulge shape
+    # t*(1-t), which only needs scaling by distance squared, are for the
+    # float32 terrain and LOS line arrays.
+    _T_SAMPLE = np.arange(NUM_SAMPLES) / (NUM_SAMPLES - 1)
+    _T = _T_SAMPLE.astype(np.float32)
+    _BULGE_SHAPE = _T * (1.0 - _T)
+    BATCH_SIZE = 4096  # Pairs per block in check_pairs, bounds (pairs, samples) arrays
 
     def __init__(
         self,
         peak1: Peak,
         peak2: Peak,
-        elevation_cache: Optional[Dict[str, List[float]]] = None,
+        elevation_cache: Optional[ElevationGrid] = None,
+        distance_km: Optional[float] = None,
     ):
         """
         Initialize calculator with two peaks.
@@ -57,100 +100,122 @@ class LOSCalculator:
         Args:
             peak1: Dict with keys: name, lat, lon, elevation_m
             peak2: Dict with keys: name, lat, lon, elevation_m
-            elevation_cache: Optional cache dict mapping coordinate keys to elevation lists
+            elevation_cache: Optional preloaded elevation grid
+            distance_km: Optional precomputed distance between the peaks in km,
+                e.g. from PeakPairFinder.get_peak_pairs
         """
         self.peak1 = peak1
         self.peak2 = peak2
-        self.elevation_cache = elevation_cache or self._load_cache()
+        self.elevation_cache = (
+            elevation_cache if elevation_cache is not None else self._load_cache()
+        )
         self._calculated = False
+        self._precomputed_distance_km = distance_km
         self._distance_km: float = 0.0
-        self._los_limit_km: float = 0.0
-        self._terrain_array: npt.NDArray[np.float64] = np.array([])
-        self._distances: npt.NDArray[np.float64] = np.array([])
-        self._los_line: npt.NDArray[np.float64] = np.array([])
-        self._curvature_drop_m: float = 0.0
+        self._terrain_array: npt.NDArray[np.float32] = np.array([], dtype=np.float32)
+        self._distances: npt.NDArray[np.float32] = np.array([], dtype=np.float32)
+        self._los_line: npt.NDArray[np.float32] = np.array([], dtype=np.float32)
         self._is_clear: bool = False
 
-    def _load_cache(self) -> Dict[str, List[float]]:
-        """Load elevation cache from file if it exists."""
-        cache_file = "elevation_cache.json"
-        if os.path.exists(cache_file):
-            with open(cache_file, "r") as f:
-                return json.load(f)
-        return {}
+    @classmethod
+    def from_peaks(
+        cls,
+        peaks: Peaks,
+        i: int,
+        j: int,
+        elevation_cache: Optional[ElevationGrid] = None,
+        distance_km: Optional[float] = None,
+    ) -> "LOSCalculator":
+        """
+        Initialize calculator with two peaks given by index into a collection.
+
+        Args:
+            peaks: Peaks collection, e.g. from PeakPairFinder.get_peaks
+            i: Index of the first peak
+            j: Index of the second peak
+            elevation_cache: Optional preloaded elevation grid
+            distance_km: Optional precomputed distance between the peaks in km
+        """
+        return cls(peaks[i], peaks[j], elevation_cache, distance_km)
+
+    def _load_cache(self) -> ElevationGrid:
+        """Load elevation grid from file if it exists."""
+        return ElevationGrid.load_cache()
 
     def _calculate(self):
         """Perform all calculations (called lazily)."""
         if self._calculated:
             return
 
-        coord1 = (self.peak1["lat"], self.peak1["lon"])
-        coord2 = (self.peak2["lat"], self.peak2["lon"])
-        self._distance_km = geodesic(coord1, coord2).km
-
-        self._los_limit_km = 3.57 * (
-            np.sqrt(self.peak1["elevation_m"]) + np.sqrt(self.peak2["elevation_m"])
-        )
-
-        lats = np.linspace(self.peak1["lat"], self.peak2["lat"], self.NUM_SAMPLES)
-        lons = np.linspace(self.peak1["lon"], self.peak2["lon"], self.NUM_SAMPLES)
+        if self._precomputed_distance_km is not None:
+            self._distance_km = self._precomputed_distance_km
+        else:
+            self._distance_km = float(
+                haversine_km(
+                    self.peak1["lat"],
+                    self.peak1["lon"],
+                    self.peak2["lat"],
+                    self.peak2["lon"],
+                )
+            )
+
+        t = self._T_SAMPLE
+        lats = self.peak1["lat"] + (self.peak2["lat"] - self.peak1["lat"]) * t
+        lons = self.peak1["lon"] + (self.peak2["lon"] - self.peak1["lon"]) * t
 
         terrain_elevations = self._get_elevations(lats, lons)
-        self._terrain_array = np.array(terrain_elevations)
+        self._terrain_array = terrain_elevations.astype(np.float32, copy=False)
 
         self._terrain_array[0] = self.peak1["elevation_m"]
         self._terrain_array[-1] = self.peak2["elevation_m"]
 
-        self._distances, self._los_line = self._compute_los_line()
+        if any_blocker is not None:
+            self._is_clear = not any_blocker(
+                self._terrain_array,
+                self.peak1["elevation_m"],
+                self.peak2["elevation_m"],
+                self._distance_km,
+            )
+        else:
+            self._distances, self._los_line = self._compute_los_line()
+            # The endpoints are the peaks themselves and always lie on the LOS
+            # line, but float32 rounding can put them just above it
+            self._is_clear = bool(
+                np.all(self._terrain_array[1:-1] <= self._los_line[1:-1])
+            )
 
-        R_effective = self.REFRACTION_FACTOR * self.R_EARTH_KM
-        midpoint_distance_km = self._distance_km / 2
-        self._curvature_drop_m = (midpoint_distance_km * 1000) ** 2 / (
-            2 * R_effective * 1000
-        )
+        self._calculated = True
 
-        self._is_clear = bool(np.all(self._terrain_array <= self._los_line))
+    @staticmethod
+    def _compute_los_limit_km(peak1: Peak, peak2: Peak) -> float:
+        """Compute the theoretical LOS limit between two peaks in km."""
+        return 3.57 * (np.sqrt(peak1["elevation_m"]) + np.sqrt(peak2["elevation_m"]))
 
-        self._calculated = True
+    @classmethod
+    def _compute_curvature_drop_m(cls, distance_km: float) -> float:
+        """Compute Earth's curvature drop at the path midpoint with refraction."""
+        R_effective = REFRACTION_FACTOR * R_EARTH_KM
+        midpoint_distance_km = distance_km / 2
+        return (midpoint_distance_km * 1000) ** 2 / (2 * R_effective * 1000)
 
     def _get_elevations(self, latitudes, longitudes):
-        """Get elevations from cache using nearest grid point lookup."""
-        elevations = []
-        grid_resolution = 0.01  # Cache grid spacing from prefetch_elevations
-
-        for lat, lon in zip(latitudes, longitudes):
-            # Round to nearest grid point
-            nearest_lat = round(lat / grid_resolution) * grid_resolution
-            nearest_lon = round(lon / grid_resolution) * grid_resolution
-            coord_key = f"{nearest_lat:.6f},{nearest_lon:.6f}"
-            
-            if coord_key in self.elevation_cache:
-                elevations.append(self.elevation_cache[coord_key])
-            else:
-                # Fallback: try exact match
-                exact_key = f"{lat:.6f},{lon:.6f}"
-                if exact_key in self.elevation_cache:
-                    elevations.append(self.elevation_cache[exact_key])
-                else:
-                    elevations.append(0.0)
-
-        return elevations
+        """Get elevations from the cache grid using nearest grid point lookup."""
+        return self.elevation_cache.lookup(latitudes, longitudes)
 
     def _compute_los_line(self):
         """Compute LOS line accounting for Earth's curvature with atmospheric refraction."""
-        R_effective = self.REFRACTION_FACTOR * self.R_EARTH_KM
+        R_effective = REFRACTION_FACTOR * R_EARTH_KM
 
-        distances = np.linspace(0, self._distance_km, self.NUM_SAMPLES)
+        distances = self._T * self._distance_km
 
-        straight_line = self.peak1["elevation_m"] + (
-            self.peak2["elevation_m"] - self.peak1["elevation_m"]
-        ) * (distances / self._distance_km)
+        straight_line = (
+            self.peak1["elevation_m"]
+            + (self.peak2["elevation_m"] - self.peak1["elevation_m"]) * self._T
+        )
 
         earth_bulge_m = (
-            -(distances * 1000)
-            * ((self._distance_km - distances) * 1000)
-            / (2 * R_effective * 1000)
-        )
+            -((self._distance_km * 1000) ** 2) / (2 * R_effective * 1000)
+        ) * self._BULGE_SHAPE
 
         los_line = straight_line + earth_bulge_m
 
@@ -177,37 +242,160 @@ class LOSCalculator:
         if not self._calculated:
             self._calculate()
 
-        stats = []
-        stats.append(
-            f"Peak 1: {self.peak1['name']} ({self.peak1['lat']}, {self.peak1['lon']})"
-        )
-        stats.append(
-            f"Peak 2: {self.peak2['name']} ({self.peak2['lat']}, {self.peak2['lon']})"
+        return self.format_statistics(
+            self.peak1, self.peak2, self._distance_km, self._is_clear
         )
-        stats.append(f"Great-circle distance: {self._distance_km:.2f} km")
-        stats.append(f"Theoretical LOS limit: {self._los_limit_km:.2f} km")
+
+    @classmethod
+    def format_statistics(
+        cls, peak1: Peak, peak2: Peak, distance_km: float, is_clear: bool
+    ) -> str:
+        """
+        Format statistics for a pair whose LOS has already been determined.
+
+        Used by the batch path in main.py, where clearance is computed for all
+        pairs at once by los_kernel.los_batch.
+
+        Args:
+            peak1: First peak
+            peak2: Second peak
+            distance_km: Great-circle distance between the peaks in km
+            is_clear: Whether the line-of-sight is clear
+
+        Returns:
+            str: Formatted statistics including distance, LOS limit, curvature, and clearance
+        """
+        los_limit_km = cls._compute_los_limit_km(peak1, peak2)
+        curvature_drop_m = cls._compute_curvature_drop_m(distance_km)
+
+        stats = []
+        stats.append(f"Peak 1: {peak1['name']} ({peak1['lat']}, {peak1['lon']})")
+        stats.append(f"Peak 2: {peak2['name']} ({peak2['lat']}, {peak2['lon']})")
+        stats.append(f"Great-circle distance: {distance_km:.2f} km")
+        stats.append(f"Theoretical LOS limit: {los_limit_km:.2f} km")
         stats.append(
-            f"Earth curvature drop at midpoint: {self._curvature_drop_m:.1f} m (with refraction)"
+            f"Earth curvature drop at midpoint: {curvature_drop_m:.1f} m (with refraction)"
         )
         stats.append(
-            f"Line-of-sight is {'CLEAR' if self._is_clear else 'BLOCKED'} by terrain."
+            f"Line-of-sight is {'CLEAR' if is_clear else 'BLOCKED'} by terrain."
         )
 
         return "\n".join(stats)
 
+    @classmethod
+    def check_pairs(
+        cls,
+        peaks: Peaks,
+        rows: npt.NDArray[np.intp],
+        cols: npt.NDArray[np.intp],
+        distance_km: npt.NDArray[np.float64],
+        elevation_cache: ElevationGrid,
+    ) -> npt.NDArray[np.bool_]:
+        """
+        Check line-of-sight for many pairs at once with vectorized NumPy.
+
+        Each block of pairs is sampled as a (pairs, NUM_SAMPLES) matrix, so the
+        Python overhead is paid per block instead of per pair. This is the
+        NumPy equivalent of los_kernel.los_batch, used when Numba is unavailable.
+
+        Args:
+            peaks: Peaks collection
+            rows: Index of the first peak of each pair
+            cols: Index of the second peak of each pair
+            distance_km: Distance of each pair in km
+            elevation_cache: Elevation grid
+
+        Returns:
+            Array with True for each pair whose LOS is clear
+        """
+        is_clear = np.empty(len(rows), dtype=np.bool_)
+
+        R_effective = REFRACTION_FACTOR * R_EARTH_KM
+        # The endpoints are the peaks themselves and always lie on the LOS line
+        t_sample = cls._T_SAMPLE[1:-1]
+        t = cls._T[1:-1]
+        bulge_shape = cls._BULGE_SHAPE[1:-1]
+
+        for start in range(0, len(rows), cls.BATCH_SIZE):
+            block = slice(start, start + cls.BATCH_SIZE)
+            lat1 = peaks.lats[rows[block]]
+            lon1 = peaks.lons[rows[block]]
+            elev1 = peaks.elevs[rows[block]].astype(np.float32)
+            lat2 = peaks.lats[cols[block]]
+            lon2 = peaks.lons[cols[block]]
+            elev2 = peaks.elevs[cols[block]].astype(np.float32)
+            dkm = distance_km[block].astype(np.float32)
+
+            lats = lat1[:, None] + (lat2 - lat1)[:, None] * t_sample
+            lons = lon1[:, None] + (lon2 - lon1)[:, None] * t_sample
+            terrain = elevation_cache.lookup(lats, lons)
+
+            straight_line = elev1[:, None] + (elev2 - elev1)[:, None] * t
+            bulge_scale_m = -((dkm * 1000) ** 2) / (2 * R_effective * 1000)
+            earth_bulge_m = bulge_scale_m[:, None] * bulge_shape
+
+            is_clear[block] = (terrain <= straight_line + earth_bulge_m).all(axis=1)
+
+        return is_clear
+
+    @classmethod
+    def profile_key(cls, peak1: Peak, peak2: Peak, distance_km: float) -> str:
+        """
+        Get the content key identifying the elevation profile of a pair.
+
+        Args:
+            peak1: First peak
+            peak2: Second peak
+            distance_km: Distance between the peaks in km
+
+        Returns:
+            str: 12 hex digit key, also used as the profile filename suffix
+        """
+        key_source = f"{peak1['name']}|{peak2['name']}|{distance_km:.1f}"
+        return hashlib.blake2s(key_source.encode()).hexdigest()[:12]
+
+    def _profile_filename(self, distance_km: float) -> str:
+        """Path of this pair's elevation profile image."""
+        name1 = self.peak1["name"].lower().replace(" ", "_")
+        name2 = self.peak2["name"].lower().replace(" ", "_")
+        rounded_km = int(round(distance_km))
+        key = self.profile_key(self.peak1, self.peak2, distance_km)
+        return f"{self.PROFILE_DIR}/{name1}_to_{name2}_{rounded_km}km_{key}.png"
+
     def generate_elevation_profile(self):
         """
         Generate and save elevation profile graph.
 
-        The file is saved as {peak1_name}_to_{peak2_name}.png (lowercase, no spaces).
+        The file is saved as {peak1_name}_to_{peak2_name}_{distance}km_{key}.png
+        (lowercase, no spaces), where key is from profile_key. Rendering is
+        skipped if that file already exists.
         """
+        # With a precomputed distance the filename is known up front, so an
+        # existing profile is skipped without sampling the terrain
+        distance_km = (
+            self._distance_km if self._calculated else self._precomputed_distance_km
+        )
+        if distance_km is None:
+            self._calculate()
+            distance_km = self._distance_km
+
+        filename = self._profile_filename(distance_km)
+        if os.path.exists(filename):
+            return
+
         if not self._calculated:
             self._calculate()
 
-        plt.style.use("seaborn-v0_8")
-        plt.figure(figsize=(12, 6))
+        # Only built here, the clearance check does not need the full LOS line
+        if self._los_line.size == 0:
+            self._distances, self._los_line = self._compute_los_line()
 
-        plt.plot(
+        fig, ax = _get_profile_axes()
+        # Clearing the axes keeps the subplot layout, so tight_layout runs once
+        needs_layout = not ax.has_data()
+        ax.clear()
+
+        ax.plot(
             self._distances,
             self._terrain_array,
             label="Terrain Elevation",
@@ -215,7 +403,7 @@ class LOSCalculator:
             linewidth=2,
         )
 
-        plt.plot(
+        ax.plot(
             self._distances,
             self._los_line,
             label="Line of Sight (with Earth curvature)",
@@ -224,10 +412,11 @@ class LOSCalculator:
             linewidth=2,
         )
 
-        straight_line = self.peak1["elevation_m"] + (
-            self.peak2["elevation_m"] - self.peak1["elevation_m"]
-        ) * (self._distances / self._distances[-1])
-        plt.plot(
+        straight_line = (
+            self.peak1["elevation_m"]
+            + (self.peak2["elevation_m"] - self.peak1["elevation_m"]) * self._T
+        )
+        ax.plot(
             self._distances,
             straight_line,
             label="Straight line (no curvature)",
@@ -237,20 +426,15 @@ class LOSCalculator:
             alpha=0.7,
         )
 
-        plt.xlabel("Distance along path (km)", fontsize=11)
-        plt.ylabel("Elevation (m)", fontsize=11)
-        plt.title(
+        ax.set_xlabel("Distance along path (km)", fontsize=11)
+        ax.set_ylabel("Elevation (m)", fontsize=11)
+        ax.set_title(
             f"Elevation Profile: {self.peak1['name']} to {self.peak2['name']}",
             fontsize=13,
         )
-        plt.legend(loc="best")
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-
-        name1 = self.peak1["name"].lower().replace(" ", "_")
-        name2 = self.peak2["name"].lower().replace(" ", "_")
-        distance_km = int(round(self._distance_km))
-        filename = f"elevation_profiles/{name1}_to_{name2}_{distance_km}km.png"
+        ax.legend(loc="best")
+        ax.grid(True, alpha=0.3)
+        if needs_layout:
+            fig.tight_layout()
 
-        plt.savefig(filename)
-        plt.close()
+        fig.savefig(filename, dpi=80)
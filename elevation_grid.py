@@ -0,0 +1,189 @@
+"""Dense elevation grid built from the prefetched elevation cache."""
+
+import io
+import os
+import numpy as np
+import numpy.typing as npt
+import orjson
+import zstandard
+from typing import Dict
+
+
+class ElevationGrid:
+    """
+    Elevations on a regular lat/lon grid with O(1) nearest-point lookup.
+
+    Row i and column j hold the elevation at (lat0 + i * res, lon0 + j * res).
+    Grid points that were never fetched hold 0.0.
+    """
+
+    CACHE_FILE = "elevation_cache.npz"
+    POINTS_CACHE_FILE = "elevation_points.npz.zst"
+    JSON_CACHE_FILE = "elevation_cache.json"
+    GRID_RESOLUTION = 0.01  # Cache grid spacing from prefetch_elevations
+
+    def __init__(
+        self,
+        grid: npt.NDArray[np.float32],
+        lat0: float,
+        lon0: float,
+        res: float = GRID_RESOLUTION,
+    ):
+        """
+        Initialize grid.
+
+        Args:
+            grid: 2-D array of elevations in meters indexed by (lat_idx, lon_idx)
+            lat0: Latitude of the first grid row in degrees
+            lon0: Longitude of the first grid column in degrees
+            res: Grid spacing in degrees
+        """
+        self.grid = grid
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self.res = float(res)
+
+    @classmethod
+    def _from_indices(
+        cls,
+        lat_idx: npt.NDArray[np.intp],
+        lon_idx: npt.NDArray[np.intp],
+        elevations: npt.NDArray[np.float32],
+        res: float,
+    ) -> "ElevationGrid":
+        """Scatter elevations at integer grid indices into a dense grid."""
+        if lat_idx.size == 0:
+            return cls(np.zeros((0, 0), dtype=np.float32), 0.0, 0.0, res)
+
+        lat_min, lon_min = lat_idx.min(), lon_idx.min()
+        grid = np.zeros(
+            (lat_idx.max() - lat_min + 1, lon_idx.max() - lon_min + 1),
+            dtype=np.float32,
+        )
+        grid[lat_idx - lat_min, lon_idx - lon_min] = elevations
+
+        return cls(grid, lat_min * res, lon_min * res, res)
+
+    @classmethod
+    def from_json_cache(
+        cls, cache: Dict[str, float], res: float = GRID_RESOLUTION
+    ) -> "ElevationGrid":
+        """
+        Build a dense grid from the legacy JSON cache dict.
+
+        Args:
+            cache: Dict mapping "lat,lon" strings to elevations in meters
+            res: Grid spacing of the cache in degrees
+
+        Returns:
+            ElevationGrid covering the bounding box of all cached points
+        """
+        if not cache:
+            return cls(np.zeros((0, 0), dtype=np.float32), 0.0, 0.0, res)
+
+        # Parse all "lat,lon" keys in one pass instead of splitting each key
+        coords = np.array(",".join(cache.keys()).split(","), dtype=np.float64)
+        coords = coords.reshape(-1, 2)
+        lat_idx = np.rint(coords[:, 0] / res).astype(np.intp)
+        lon_idx = np.rint(coords[:, 1] / res).astype(np.intp)
+        elevations = np.fromiter(cache.values(), dtype=np.float32, count=len(cache))
+
+        return cls._from_indices(lat_idx, lon_idx, elevations, res)
+
+    @classmethod
+    def load(cls, path: str = CACHE_FILE) -> "ElevationGrid":
+        """Load a grid previously written by save()."""
+        with np.load(path) as data:
+            return cls(data["grid"], data["lat0"], data["lon0"], data["res"])
+
+    @classmethod
+    def load_cache(cls) -> "ElevationGrid":
+        """
+        Load the elevation grid, building it from the prefetched points on first use.
+
+        Falls back to the legacy JSON cache, and returns an empty grid (all
+        lookups 0.0) if no cache exists yet.
+        """
+        # Rebuild the grid whenever the prefetcher has rewritten the points
+        points_mtime = (
+            os.path.getmtime(cls.POINTS_CACHE_FILE)
+            if os.path.exists(cls.POINTS_CACHE_FILE)
+            else 0.0
+        )
+        if (
+            os.path.exists(cls.CACHE_FILE)
+            and os.path.getmtime(cls.CACHE_FILE) >= points_mtime
+        ):
+            return cls.load(cls.CACHE_FILE)
+
+        if os.path.exists(cls.POINTS_CACHE_FILE):
+            print(f"Building {cls.CACHE_FILE} from {cls.POINTS_CACHE_FILE}...")
+            with open(cls.POINTS_CACHE_FILE, "rb") as f:
+                archive = zstandard.ZstdDecompressor().decompress(f.read())
+            with np.load(io.BytesIO(archive)) as points:
+                # The prefetcher writes one set of columns per region
+                regions = range(int(points["num_regions"]))
+                lat_idx, lon_idx, elevs = (
+                    np.concatenate([points[f"{column}_{i}"] for i in regions])
+                    for column in ("lat_idx", "lon_idx", "elev")
+                )
+                elevation_grid = cls._from_indices(
+                    lat_idx.astype(np.intp),
+                    lon_idx.astype(np.intp),
+                    elevs,
+                    float(points["res"]),
+                )
+            elevation_grid.save(cls.CACHE_FILE)
+            return elevation_grid
+
+        if os.path.exists(cls.JSON_CACHE_FILE):
+            print(f"Converting {cls.JSON_CACHE_FILE} to {cls.CACHE_FILE}...")
+            with open(cls.JSON_CACHE_FILE, "rb") as f:
+                elevation_grid = cls.from_json_cache(orjson.loads(f.read()))
+            elevation_grid.save(cls.CACHE_FILE)
+            return elevation_grid
+
+        return cls.from_json_cache({})
+
+    def save(self, path: str = CACHE_FILE):
+        """Save grid and its header to an .npz file."""
+        np.savez(
+            path,
+            grid=self.grid,
+            lat0=self.lat0,
+            lon0=self.lon0,
+            res=self.res,
+            shape=np.array(self.grid.shape),
+        )
+
+    def lookup(self, latitudes, longitudes) -> npt.NDArray[np.float32]:
+        """
+        Get elevations at the nearest grid points.
+
+        Args:
+            latitudes: Array of latitudes in degrees
+            longitudes: Array of longitudes in degrees
+
+        Returns:
+            Array of elevations in meters, 0.0 where outside the grid
+        """
+        lat_idx = np.rint((np.asarray(latitudes) - self.lat0) / self.res).astype(
+            np.intp
+        )
+        lon_idx = np.rint((np.asarray(longitudes) - self.lon0) / self.res).astype(
+            np.intp
+        )
+        in_bounds = (
+            (lat_idx >= 0)
+            & (lat_idx < self.grid.shape[0])
+            & (lon_idx >= 0)
+            & (lon_idx < self.grid.shape[1])
+        )
+
+        elevations = np.zeros(lat_idx.shape, dtype=np.float32)
+        elevations[in_bounds] = self.grid[lat_idx[in_bounds], lon_idx[in_bounds]]
+        return elevations
+
+    def __len__(self) -> int:
+        """Number of grid points."""
+        return self.grid.size
@@ -0,0 +1,32 @@
+"""
+Earth model shared by the LOS calculator, the pair finder and the LOS kernel.
+
+Plain NumPy with no Numba import, so every path can use it. los_kernel
+compiles its haversine_km from the function defined here.
+"""
+
+import numpy as np
+
+R_EARTH_KM = 6371.0
+REFRACTION_FACTOR = 4.0 / 3.0  # Standard atmospheric refraction, k = 4/3
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in km, element-wise over scalars or arrays.
+
+    Accurate to well under 0.5% at the distances used here.
+
+    Args:
+        lat1, lon1: First point(s) in degrees
+        lat2, lon2: Second point(s) in degrees
+
+    Returns:
+        Distance in km, a float for scalar inputs
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * R_EARTH_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
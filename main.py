@@ -1,34 +1,84 @@
 """Main script to analyze line-of-sight for all peak pairs."""
 
-import json
+import hashlib
 import os
+import numpy as np
 from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
 from calculate_los import LOSCalculator
+from elevation_grid import ElevationGrid
 from peak_pair_finder import PeakPairFinder
 from prefetch_elevations import ElevationPrefetcher
 from prefetch_peaks import PeakPrefetcher
 
+try:
+    from los_kernel import los_batch
+except ImportError:
+    try:
+        # Serial ahead-of-time build from build_los_kernel.py
+        from los_kernel_aot import los_batch
+    except ImportError:
+        # Fall back to the vectorized NumPy path in LOSCalculator.check_pairs
+        los_batch = None
 
-def process_peak_pair(peak1, peak2, cache):
+
+# Per-worker view of the elevation grid held in shared memory (see _init_worker)
+CACHE_GRID = None
+_CACHE_SHM = None
+
+
+def _init_worker(shm_name, shape, dtype, lat0, lon0, res):
+    """
+    Attach a worker process to the shared elevation grid.
+
+    Args:
+        shm_name: Name of the SharedMemory block holding the grid
+        shape: Grid array shape
+        dtype: Grid array dtype
+        lat0: Latitude of the first grid row in degrees
+        lon0: Longitude of the first grid column in degrees
+        res: Grid spacing in degrees
     """
-    Process a single peak pair for LOS analysis.
-    
+    global CACHE_GRID, _CACHE_SHM
+    _CACHE_SHM = SharedMemory(name=shm_name)
+    grid = np.ndarray(shape, dtype=dtype, buffer=_CACHE_SHM.buf)
+    CACHE_GRID = ElevationGrid(grid, lat0, lon0, res)
+
+
+def process_peak_pair(peak1, peak2, distance_km):
+    """
+    Generate the elevation profile for a single peak pair with clear LOS.
+
     Args:
         peak1: First peak dictionary
         peak2: Second peak dictionary
-        cache: Elevation cache dictionary
-        
+        distance_km: Distance between the peaks from PeakPairFinder
+    """
+    calculator = LOSCalculator(
+        peak1, peak2, elevation_cache=CACHE_GRID, distance_km=distance_km
+    )
+    calculator.generate_elevation_profile()
+
+
+def process_batch(pairs_chunk):
+    """
+    Generate elevation profiles for a chunk of peak pairs in one task.
+
+    Args:
+        pairs_chunk: List of (peak1, peak2, distance_km) tuples
+
     Returns:
-        Tuple of (statistics_string, is_clear)
+        List with None for each rendered pair, or the error message if it failed
     """
-    calculator = LOSCalculator(peak1, peak2, elevation_cache=cache)
-    is_clear = calculator.is_line_of_sight_clear()
-    
-    if is_clear:
-        calculator.generate_elevation_profile()
-    
-    stats = calculator.get_statistics()
-    return (stats, is_clear)
+    results = []
+    for peak1, peak2, distance_km in pairs_chunk:
+        try:
+            process_peak_pair(peak1, peak2, distance_km)
+            results.append(None)
+        except Exception as e:
+            results.append(str(e))
+    return results
+
 
 print("Step 1: Prefetching peak data...")
 peak_prefetcher = PeakPrefetcher(min_elevation_feet=13000)
@@ -39,62 +89,164 @@ elevation_prefetcher = ElevationPrefetcher()
 elevation_prefetcher.prefetch_elevations()
 
 print("\nStep 3: Loading elevation cache...")
-with open("elevation_cache.json", "r") as f:
-    cache = json.load(f)
+cache = ElevationGrid.load_cache()
 print(f"Loaded {len(cache)} elevation grid points")
 
 print("\nStep 4: Finding peak pairs...")
 finder = PeakPairFinder(min_elevation_feet=13000)
-pairs = finder.get_peak_pairs(min_distance_km=331, max_distance_km=500)
-print(f"Found {len(pairs)} peak pairs between 350-500km apart")
+peaks = finder.get_peaks()
+rows, cols, pair_distance_km = finder.get_peak_pair_indices(
+    min_distance_km=331, max_distance_km=500
+)
+num_pairs = len(rows)
+print(f"Found {num_pairs} peak pairs between 350-500km apart")
 
 print("\nStep 5: Analyzing line-of-sight for all pairs...")
 
+if los_batch is not None:
+    pair_clear = np.empty(num_pairs, dtype=np.bool_)
+
+    los_batch(
+        peaks.lats[rows],
+        peaks.lons[rows],
+        peaks.elevs[rows],
+        peaks.lats[cols],
+        peaks.lons[cols],
+        peaks.elevs[cols],
+        pair_distance_km,
+        cache.grid,
+        cache.lat0,
+        cache.lon0,
+        cache.res,
+        pair_clear,
+    )
+else:
+    pair_clear = LOSCalculator.check_pairs(peaks, rows, cols, pair_distance_km, cache)
+
+print("\nStep 6: Saving statistics...")
+with open("elevation_profiles/statistics.txt", "w", buffering=1 << 20) as f:
+    for i, j, is_clear, distance_km in zip(rows, cols, pair_clear, pair_distance_km):
+        f.write(
+            LOSCalculator.format_statistics(
+                peaks[i], peaks[j], distance_km, bool(is_clear)
+            )
+        )
+        f.write("\n\n")
+
+clear_pairs = [
+    (peaks[i], peaks[j], float(distance_km))
+    for i, j, is_clear, distance_km in zip(rows, cols, pair_clear, pair_distance_km)
+    if is_clear
+]
+clear_count = len(clear_pairs)
+blocked_count = num_pairs - clear_count
+print(f"  Clear: {clear_count} | Blocked: {blocked_count}")
+
+print("\nStep 7: Generating elevation profiles for clear pairs...")
+
+# Keys of profiles rendered by earlier runs, so reruns skip them without a stat()
+# per profile. The first line fingerprints the elevation grid they were drawn
+# from, so refreshed elevation data re-renders them.
+manifest_file = os.path.join(LOSCalculator.PROFILE_DIR, "manifest.txt")
+grid_fingerprint = hashlib.blake2b(np.ascontiguousarray(cache.grid)).hexdigest()[:16]
+manifest_lines = []
+if os.path.exists(manifest_file):
+    with open(manifest_file, "r") as f:
+        manifest_lines = f.read().split()
+
+# Profile filenames end in _{key}.png, with the 12 hex digit key from profile_key
+profile_files = {
+    name[-16:-4]: name
+    for name in os.listdir(LOSCalculator.PROFILE_DIR)
+    if name.endswith(".png")
+}
+if manifest_lines[:1] == [grid_fingerprint]:
+    # Profiles deleted since they were rendered are rendered again
+    rendered_keys = set(manifest_lines[1:]) & profile_files.keys()
+else:
+    # Drawn from different elevation data; delete them so they are re-rendered
+    for key in manifest_lines:
+        if key in profile_files:
+            os.remove(os.path.join(LOSCalculator.PROFILE_DIR, profile_files[key]))
+    rendered_keys = set()
+
+with open(manifest_file, "w") as f:
+    f.write(grid_fingerprint + "\n")
+    f.writelines(key + "\n" for key in sorted(rendered_keys))
+
+pending_pairs = [
+    (peak1, peak2, distance_km)
+    for peak1, peak2, distance_km in clear_pairs
+    if LOSCalculator.profile_key(peak1, peak2, distance_km) not in rendered_keys
+]
+print(f"  Skipping {clear_count - len(pending_pairs)} already rendered profiles")
+
 # Use more workers than CPU cores to compensate for I/O blocking during plot generation
 num_workers = os.cpu_count() or 24
 print(f"Using {num_workers} parallel workers to maximize CPU utilization")
 
-statistics_lines = []
-clear_count = 0
-blocked_count = 0
+# One task per chunk amortizes the executor's per-task overhead, while keeping
+# enough chunks that every worker stays busy
+chunk_size = max(1, min(128, -(-len(pending_pairs) // (num_workers * 4))))
+chunks = [
+    pending_pairs[i : i + chunk_size] for i in range(0, len(pending_pairs), chunk_size)
+]
+
 completed_count = 0
 
-# Process pairs in parallel
-with ProcessPoolExecutor(max_workers=num_workers) as executor:
-    # Submit all tasks
-    future_to_pair = {
-        executor.submit(process_peak_pair, peak1, peak2, cache): (peak1, peak2)
-        for peak1, peak2 in pairs
-    }
-    
-    # Process results as they complete
-    for future in as_completed(future_to_pair):
-        completed_count += 1
-        
-        try:
-            stats, is_clear = future.result()
-            statistics_lines.append(stats)
-            statistics_lines.append("")
-            
-            if is_clear:
-                clear_count += 1
-            else:
-                blocked_count += 1
-        except Exception as e:
-            print(f"  Error processing pair: {e}")
-            blocked_count += 1
-        
-        # Show progress every 10 pairs or at completion
-        if completed_count % 10 == 0 or completed_count == len(pairs):
-            percentage = (completed_count / len(pairs)) * 100
-            print(f"  Progress: {completed_count}/{len(pairs)} ({percentage:.1f}%) | Clear: {clear_count} | Blocked: {blocked_count}")
-
-print(f"\nStep 6: Saving statistics...")
-with open("elevation_profiles/statistics.txt", "w") as f:
-    f.write("\n".join(statistics_lines))
+# Copy the grid into shared memory once so tasks don't pickle it
+shm = SharedMemory(create=True, size=max(cache.grid.nbytes, 1))
+shared_grid = np.ndarray(cache.grid.shape, dtype=cache.grid.dtype, buffer=shm.buf)
+shared_grid[:] = cache.grid
+
+try:
+    # Render profiles in parallel
+    with open(manifest_file, "a") as manifest, ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(
+            shm.name,
+            cache.grid.shape,
+            cache.grid.dtype,
+            cache.lat0,
+            cache.lon0,
+            cache.res,
+        ),
+    ) as executor:
+        # Submit all chunks
+        future_to_chunk = {
+            executor.submit(process_batch, chunk): chunk for chunk in chunks
+        }
+
+        # Process results as they complete
+        for future in as_completed(future_to_chunk):
+            chunk = future_to_chunk[future]
+            completed_count += len(chunk)
+
+            try:
+                errors = future.result()
+            except Exception as e:
+                errors = [str(e)] * len(chunk)
+
+            for (peak1, peak2, distance_km), error in zip(chunk, errors):
+                if error is None:
+                    key = LOSCalculator.profile_key(peak1, peak2, distance_km)
+                    manifest.write(key + "\n")
+                else:
+                    print(f"  Error processing pair: {error}")
+
+            # Show progress after every chunk
+            percentage = (completed_count / len(pending_pairs)) * 100
+            print(
+                f"  Progress: {completed_count}/{len(pending_pairs)} ({percentage:.1f}%)"
+            )
+finally:
+    del shared_grid
+    shm.close()
+    shm.unlink()
 
 print(f"\nComplete!")
-print(f"  Total pairs analyzed: {len(pairs)}")
+print(f"  Total pairs analyzed: {num_pairs}")
 print(f"  Clear LOS: {clear_count}")
 print(f"  Blocked LOS: {blocked_count}")
 print(f"  Statistics saved to: elevation_profiles/statistics.txt")
@@ -1,6 +1,8 @@
 """Peak data structure definition."""
 
-from typing import TypedDict
+import numpy as np
+import numpy.typing as npt
+from typing import List, TypedDict
 
 
 class Peak(TypedDict):
@@ -9,3 +11,51 @@ class Peak(TypedDict):
     lat: float
     lon: float
     elevation_m: float
+
+
+class Peaks:
+    """Structure-of-arrays collection of peaks for vectorized numeric code."""
+
+    def __init__(
+        self,
+        names: List[str],
+        lats: npt.NDArray[np.float64],
+        lons: npt.NDArray[np.float64],
+        elevs: npt.NDArray[np.float64],
+    ):
+        """
+        Initialize peak collection.
+
+        Args:
+            names: Peak names
+            lats: Latitudes in degrees
+            lons: Longitudes in degrees
+            elevs: Elevations in meters
+        """
+        self.names = names
+        self.lats = lats
+        self.lons = lons
+        self.elevs = elevs
+
+    @classmethod
+    def from_list(cls, peaks: List[Peak]) -> "Peaks":
+        """Build a collection from a list of Peak dictionaries."""
+        return cls(
+            [peak["name"] for peak in peaks],
+            np.array([peak["lat"] for peak in peaks], dtype=np.float64),
+            np.array([peak["lon"] for peak in peaks], dtype=np.float64),
+            np.array([peak["elevation_m"] for peak in peaks], dtype=np.float64),
+        )
+
+    def __len__(self) -> int:
+        """Number of peaks."""
+        return len(self.names)
+
+    def __getitem__(self, i: int) -> Peak:
+        """Get a single peak as a Peak dictionary."""
+        return {
+            "name": self.names[i],
+            "lat": float(self.lats[i]),
+            "lon": float(self.lons[i]),
+            "elevation_m": float(self.elevs[i]),
+        }
@@ -1,17 +1,22 @@
 """Find and pair peaks in the US."""
 
-import json
 import os
-from geopy.distance import geodesic
+import numpy as np
+import numpy.typing as npt
+import orjson
+import zstandard
+from scipy.spatial import cKDTree
 from typing import List, Tuple
 
-from peak import Peak
+from geodesy import R_EARTH_KM, haversine_km
+from peak import Peak, Peaks
 
 
 class PeakPairFinder:
     """Find peaks over a given elevation and generate valid pairings."""
 
-    CACHE_FILE = "peaks_cache.json"
+    CACHE_FILE = "peaks_cache.json.zst"
+    LEGACY_CACHE_FILE = "peaks_cache.json"
 
     def __init__(self, min_elevation_feet: int = 13000):
         """
@@ -22,17 +27,22 @@ class PeakPairFinder:
         """
         self.min_elevation_feet = min_elevation_feet
         self.min_elevation_m = min_elevation_feet * 0.3048
-        self._peaks: List[Peak] = []
+        self._peaks = Peaks.from_list([])
         self._peaks_loaded = False
 
-    def _load_peaks_from_cache(self) -> List[Peak]:
-        """Load peaks from cache file."""
-        if not os.path.exists(self.CACHE_FILE):
+    def _load_peaks_from_cache(self) -> Peaks:
+        """Load peaks from the compressed cache file, or the legacy JSON one."""
+        if os.path.exists(self.CACHE_FILE):
+            with open(self.CACHE_FILE, "rb") as f:
+                data = zstandard.ZstdDecompressor().decompress(f.read())
+        elif os.path.exists(self.LEGACY_CACHE_FILE):
+            with open(self.LEGACY_CACHE_FILE, "rb") as f:
+                data = f.read()
+        else:
             raise FileNotFoundError(
                 f"{self.CACHE_FILE} not found. Please run peak prefetching first."
             )
-        with open(self.CACHE_FILE, "r") as f:
-            return json.load(f)
+        return Peaks.from_list(orjson.loads(data))
 
     def _load_peaks(self):
         """Load peaks from cache."""
@@ -40,37 +50,84 @@ class PeakPairFinder:
             self._peaks = self._load_peaks_from_cache()
             self._peaks_loaded = True
 
-    def _calculate_distance_km(self, peak1: Peak, peak2: Peak) -> float:
-        """Calculate great-circle distance between two peaks in km."""
-        coord1 = (peak1["lat"], peak1["lon"])
-        coord2 = (peak2["lat"], peak2["lon"])
-        return geodesic(coord1, coord2).km
+    def get_peaks(self) -> Peaks:
+        """
+        Get all cached peaks.
 
-    def get_peak_pairs(
+        Returns:
+            Peaks collection that get_peak_pair_indices indexes into
+        """
+        self._load_peaks()
+        return self._peaks
+
+    def get_peak_pair_indices(
         self, min_distance_km: float = 300, max_distance_km: float = 600
-    ) -> List[Tuple[Peak, Peak]]:
+    ) -> Tuple[npt.NDArray[np.intp], npt.NDArray[np.intp], npt.NDArray[np.float64]]:
         """
-        Get all unique pairs of peaks within specified distance range.
+        Get index arrays of all unique peak pairs within specified distance range.
+
+        Candidate pairs come from a KD-tree over the peaks' 3-D unit-sphere
+        positions, so only peaks within max_distance_km of each other are
+        considered. Distances use the haversine formula, which is well within
+        0.5% of the geodesic distance over the ranges this is used for.
 
         Args:
             min_distance_km: Minimum distance between peaks in kilometers
             max_distance_km: Maximum distance between peaks in kilometers
 
         Returns:
-            List of tuples, each containing two Peak dictionaries
+            Tuple of (first peak indices, second peak indices, distances in km)
+            into the collection returned by get_peaks
         """
         self._load_peaks()
 
-        pairs: List[Tuple[Peak, Peak]] = []
-
-        for i in range(len(self._peaks)):
-            for j in range(i + 1, len(self._peaks)):
-                peak1 = self._peaks[i]
-                peak2 = self._peaks[j]
+        no_pairs = (
+            np.empty(0, dtype=np.intp),
+            np.empty(0, dtype=np.intp),
+            np.empty(0, dtype=np.float64),
+        )
+        if len(self._peaks) < 2:
+            return no_pairs
+
+        lat = np.deg2rad(self._peaks.lats)
+        lon = np.deg2rad(self._peaks.lons)
+        xyz = R_EARTH_KM * np.column_stack(
+            (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat))
+        )
+
+        # Chord length matching the maximum great-circle distance
+        max_chord_km = (
+            2 * R_EARTH_KM * np.sin(min(max_distance_km / (2 * R_EARTH_KM), np.pi / 2))
+        )
+        candidates = cKDTree(xyz).query_pairs(r=max_chord_km, output_type="ndarray")
+        if candidates.size == 0:
+            return no_pairs
+
+        candidates = candidates[np.lexsort((candidates[:, 1], candidates[:, 0]))]
+        rows, cols = candidates[:, 0], candidates[:, 1]
+        lats, lons = self._peaks.lats, self._peaks.lons
+        distances = haversine_km(lats[rows], lons[rows], lats[cols], lons[cols])
+        in_range = (distances >= min_distance_km) & (distances <= max_distance_km)
+
+        return rows[in_range], cols[in_range], distances[in_range]
 
-                distance = self._calculate_distance_km(peak1, peak2)
+    def get_peak_pairs(
+        self, min_distance_km: float = 300, max_distance_km: float = 600
+    ) -> List[Tuple[Peak, Peak, float]]:
+        """
+        Get all unique pairs of peaks within specified distance range.
 
-                if min_distance_km <= distance <= max_distance_km:
-                    pairs.append((peak1, peak2))
+        Args:
+            min_distance_km: Minimum distance between peaks in kilometers
+            max_distance_km: Maximum distance between peaks in kilometers
 
-        return pairs
+        Returns:
+            List of (peak1, peak2, distance_km) tuples
+        """
+        rows, cols, distances = self.get_peak_pair_indices(
+            min_distance_km, max_distance_km
+        )
+        return [
+            (self._peaks[i], self._peaks[j], float(distance))
+            for i, j, distance in zip(rows, cols, distances)
+        ]
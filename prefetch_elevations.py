@@ -1,16 +1,49 @@
 """Prefetch elevation data for geographic regions."""
 
-import json
+import asyncio
+import hashlib
+import httpx
+import io
 import os
+import zipfile
+import zstandard
 import numpy as np
-import requests
-from typing import Dict, List, Tuple
+import numpy.typing as npt
+import orjson
+from typing import List, Tuple
+
+try:
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import from_bounds
+except ImportError:
+    rasterio = None
 
 
 class ElevationPrefetcher:
     """Prefetch and cache elevation data for geographic regions."""
 
-    CACHE_FILE = "elevation_cache.json"
+    CACHE_FILE = "elevation_points.npz.zst"
+    LEGACY_CACHE_FILE = "elevation_cache.json"
+    REGION_CACHE_DIR = "elevation_cache"
+    MANIFEST_FILE = os.path.join(REGION_CACHE_DIR, "manifest.json")
+    ELEVATION_URL = "https://api.open-elevation.com/api/v1/lookup"
+    JSON_HEADERS = {"Content-Type": "application/json"}
+    # Decoded transparently by httpx (zstd via the zstandard package). Listing
+    # an encoding httpx cannot decode, such as br without brotli, would break
+    # responses, so keep this to what is installed.
+    ACCEPT_ENCODING = "gzip, deflate, zstd"
+    MAX_CONCURRENT_REQUESTS = 16
+    MAX_RETRIES = 3
+    TOO_LARGE_STATUSES = {400, 413}  # Retried as smaller chunks
+    MIN_CHUNK_SIZE = 100  # 400s at this size are not about request size
+    RETRY_BACKOFF_S = 0.5  # Doubled after each failed attempt
+    COMPRESSION_LEVEL = 6
+    PROGRESS_STEP_PERCENT = 10  # Print fetch progress at most this often
+    # Optional local DEM (e.g. an SRTM mosaic or gdalbuildvrt .vrt) in lat/lon
+    # coordinates. Read instead of querying Open-Elevation when rasterio is
+    # installed and the file exists.
+    RASTER_FILE = "srtm_mosaic.tif"
     REGIONS = [
         ("Colorado", 37.0, 41.0, -109.0, -102.0),
         ("California", 35.5, 42.0, -124.5, -114.0),
@@ -20,87 +53,484 @@ class ElevationPrefetcher:
         ("Pacific NW", 43.0, 49.0, -125.0, -116.0),
     ]
 
-    def __init__(self, resolution: float = 0.01):
+    def __init__(self, resolution: float = 0.01, chunk_size: int = 10000):
         """
         Initialize prefetcher.
 
         Args:
             resolution: Grid resolution in degrees (~0.01 = 1km spacing)
+            chunk_size: Points per Open-Elevation request. Halved whenever the
+                server rejects a request as too large.
         """
         self.resolution = resolution
+        self.chunk_size = chunk_size
+        self._points_total = 0
+        self._points_done = 0
+        self._next_progress_percent = 0
+
+    async def _fetch_elevation_chunk(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        chunk: npt.NDArray[np.int32],
+        out: npt.NDArray[np.float32],
+    ) -> int:
+        """
+        POST one chunk of locations, retrying with exponential backoff.
+
+        A chunk the server rejects as too large is split into chunks of the
+        halved chunk_size and fetched again, so later chunks shrink too.
+
+        Args:
+            client: Shared HTTP client
+            semaphore: Caps the number of requests in flight
+            chunk: (N, 2) array of (lat, lon) grid indices
+            out: Length-N slice of the region's elevation array to fill in
+                request order, set to 0.0 if every attempt failed
+
+        Returns:
+            int: Number of points that were zero-filled because every attempt
+            failed
+        """
+        if len(chunk) > self.chunk_size:
+            # An earlier chunk was rejected as too large
+            return await self._fetch_elevation_chunks(client, semaphore, chunk, out)
+
+        async with semaphore:
+            # Serialize the body once, when the chunk is actually sent, rather
+            # than letting httpx run stdlib json.dumps on every attempt. Rounding
+            # drops float noise like -108.99000000000001 from the payload.
+            degrees = np.round(chunk * self.resolution, 9)
+            body = orjson.dumps(
+                {
+                    "locations": [
+                        {"latitude": lat, "longitude": lon}
+                        for lat, lon in degrees.tolist()
+                    ]
+                }
+            )
+            for attempt in range(self.MAX_RETRIES):
+                try:
+                    response = await client.post(
+                        self.ELEVATION_URL, content=body, headers=self.JSON_HEADERS
+                    )
+                    if response.status_code == 200:
+                        # Parsing the whole body with orjson is ~4x faster than
+                        # streaming just the elevations out with ijson (yajl2_c)
+                        # at 1k-10k points, and the parsed tree is small
+                        data = orjson.loads(response.content)
+                        out[:] = np.fromiter(
+                            (result["elevation"] for result in data["results"]),
+                            dtype=np.float32,
+                            count=len(chunk),
+                        )
+                        self._advance_progress(len(chunk))
+                        return 0
+                    if (
+                        response.status_code in self.TOO_LARGE_STATUSES
+                        and len(chunk) > self.MIN_CHUNK_SIZE
+                    ):
+                        self.chunk_size = min(self.chunk_size, len(chunk) // 2)
+                        break
+                except Exception:
+                    pass
+
+                if attempt < self.MAX_RETRIES - 1:
+                    await asyncio.sleep(self.RETRY_BACKOFF_S * 2**attempt)
+            else:
+                out[:] = 0.0
+                self._advance_progress(len(chunk))
+                return len(chunk)
 
-    def _get_elevations_batch(
-        self, coordinates: List[Tuple[float, float]], region_name: str = ""
-    ) -> List[float]:
-        """Fetch elevations for a batch of coordinates."""
-        locations = [{"latitude": lat, "longitude": lon} for lat, lon in coordinates]
-        url = "https://api.open-elevation.com/api/v1/lookup"
-        chunk_size = 1000
-        elevations = []
-        total_chunks = (len(locations) + chunk_size - 1) // chunk_size
-
-        for i in range(0, len(locations), chunk_size):
-            chunk = locations[i : i + chunk_size]
-            chunk_num = i // chunk_size + 1
-            progress = (chunk_num / total_chunks) * 100
-
-            if region_name:
-                print(
-                    f"  Fetching batch {chunk_num}/{total_chunks} ({progress:.1f}%)..."
+        # Split outside the semaphore so the halves can acquire it themselves
+        return await self._fetch_elevation_chunks(client, semaphore, chunk, out)
+
+    def _advance_progress(self, num_points: int):
+        """
+        Count finished points, printing overall progress every PROGRESS_STEP_PERCENT.
+
+        Chunks finish in any order across all regions, so this prints a
+        handful of lines per run instead of one per chunk.
+        """
+        self._points_done += num_points
+        percent = 100 * self._points_done // self._points_total
+        if percent >= self._next_progress_percent:
+            print(
+                f"  Fetched {self._points_done:,}/{self._points_total:,} points"
+                f" ({percent}%)"
+            )
+            step = self.PROGRESS_STEP_PERCENT
+            self._next_progress_percent = percent - percent % step + step
+
+    async def _fetch_elevation_chunks(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        grid_idx: npt.NDArray[np.int32],
+        out: npt.NDArray[np.float32],
+    ) -> int:
+        """
+        Fetch grid_idx in chunk_size pieces, each filling its slice of out.
+
+        Returns:
+            int: Number of points that were zero-filled because their chunk failed
+        """
+        chunk_size = self.chunk_size
+        failed = await asyncio.gather(
+            *(
+                self._fetch_elevation_chunk(
+                    client,
+                    semaphore,
+                    grid_idx[i : i + chunk_size],
+                    out[i : i + chunk_size],
                 )
+                for i in range(0, len(grid_idx), chunk_size)
+            )
+        )
+        return sum(failed)
 
-            try:
-                response = requests.post(url, json={"locations": chunk}, timeout=30)
-                if response.status_code == 200:
-                    data = response.json()
-                    elevations.extend(result["elevation"] for result in data["results"])
-                else:
-                    elevations.extend([0.0] * len(chunk))
-            except Exception:
-                elevations.extend([0.0] * len(chunk))
+    async def _get_elevations_batch_async(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        grid_idx: npt.NDArray[np.int32],
+    ) -> Tuple[npt.NDArray[np.float32], int]:
+        """
+        Fetch elevations for an (N, 2) array of grid indices concurrently.
+
+        Returns:
+            Tuple of the elevation array and the number of points in it that
+            were zero-filled because their request failed
+        """
+        elevations = np.empty(len(grid_idx), dtype=np.float32)
+
+        # Each chunk fills its own slice, so results land in order as they arrive
+        failed = await self._fetch_elevation_chunks(
+            client, semaphore, grid_idx, elevations
+        )
+        return elevations, failed
+
+    async def _process_region_async(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        region_name: str,
+        region_file: str,
+        grid_idx: npt.NDArray[np.int32],
+    ):
+        """
+        Fetch one region and save it to its region cache file.
+
+        A region with any failed requests is not saved, so the next run sees it
+        as missing and fetches it again instead of caching the zero-filled
+        points for good.
+        """
+        elevations, failed = await self._get_elevations_batch_async(
+            client, semaphore, grid_idx
+        )
+        if failed:
+            print(
+                f"  Warning: {failed:,} of {len(grid_idx):,} {region_name} points "
+                "failed and were zero-filled. Not caching the region, so the "
+                "next run fetches it again."
+            )
+            return
+        self._save_region(region_file, region_name, grid_idx, elevations)
+
+    async def _prefetch_regions_async(
+        self, regions: List[Tuple[str, str, npt.NDArray[np.int32]]]
+    ):
+        """
+        Fetch regions concurrently over one shared HTTP/2 client.
+
+        Chunk POSTs are multiplexed over the client's connections, falling back
+        to HTTP/1.1 keep-alive if the server does not negotiate h2. The
+        semaphore is shared too, so MAX_CONCURRENT_REQUESTS caps requests
+        across all regions rather than per region.
+
+        Args:
+            regions: (name, region cache file, grid indices) of each region
+        """
+        self._points_total = sum(len(grid_idx) for *_, grid_idx in regions)
+        self._points_done = 0
+        self._next_progress_percent = self.PROGRESS_STEP_PERCENT
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        limits = httpx.Limits(
+            max_connections=self.MAX_CONCURRENT_REQUESTS,
+            max_keepalive_connections=self.MAX_CONCURRENT_REQUESTS,
+        )
+        async with httpx.AsyncClient(
+            http2=True,
+            limits=limits,
+            timeout=30,
+            headers={"Accept-Encoding": self.ACCEPT_ENCODING},
+        ) as client:
+            await asyncio.gather(
+                *(
+                    self._process_region_async(client, semaphore, *region)
+                    for region in regions
+                )
+            )
+
+    def _read_elevations_local(
+        self, src: "rasterio.DatasetReader", grid_idx: npt.NDArray[np.int32]
+    ) -> npt.NDArray[np.float32]:
+        """
+        Sample elevations for a region from the local DEM.
 
-        return elevations
+        Only the window covering the region is read, decimated by GDAL to one
+        pixel per grid point, so a 1-arcsecond mosaic is never read at full
+        resolution.
+
+        Args:
+            src: Open DEM dataset in lat/lon coordinates
+            grid_idx: (N, 2) array of (lat, lon) grid indices
+
+        Returns:
+            Elevations in meters, 0.0 where the DEM has no data
+        """
+        if len(grid_idx) == 0:
+            return np.empty(0, dtype=np.float32)
+
+        lat_lo, lon_lo = grid_idx.min(axis=0)
+        lat_hi, lon_hi = grid_idx.max(axis=0)
+
+        # Pixel (row, col) of the read is centered on grid point
+        # (lat_hi - row, lon_lo + col)
+        res = self.resolution
+        window = from_bounds(
+            (lon_lo - 0.5) * res,
+            (lat_lo - 0.5) * res,
+            (lon_hi + 0.5) * res,
+            (lat_hi + 0.5) * res,
+            transform=src.transform,
+        )
+        band = src.read(
+            1,
+            window=window,
+            out_shape=(lat_hi - lat_lo + 1, lon_hi - lon_lo + 1),
+            resampling=Resampling.nearest,
+            boundless=True,
+            masked=True,
+        )
+        elevations = band.filled(0).astype(np.float32)
+        return elevations[lat_hi - grid_idx[:, 0], grid_idx[:, 1] - lon_lo]
+
+    def _prefetch_regions_local(
+        self, regions: List[Tuple[str, str, npt.NDArray[np.int32]]]
+    ):
+        """Read regions from RASTER_FILE and save them to their region files."""
+        with rasterio.open(self.RASTER_FILE) as src:
+            if src.crs is None or not src.crs.is_geographic:
+                raise ValueError(
+                    f"{self.RASTER_FILE} must use geographic (lat/lon) coordinates"
+                )
+
+            for region_name, region_file, grid_idx in regions:
+                elevations = self._read_elevations_local(src, grid_idx)
+                self._save_region(region_file, region_name, grid_idx, elevations)
 
     def _create_region_grid(
         self, south: float, north: float, west: float, east: float
-    ) -> List[Tuple[float, float]]:
-        """Create a grid of coordinates covering a geographic region."""
-        lats = np.arange(south, north, self.resolution)
-        lons = np.arange(west, east, self.resolution)
-        lat_grid, lon_grid = np.meshgrid(lats, lons)
-        return list(zip(lat_grid.flatten().tolist(), lon_grid.flatten().tolist()))
+    ) -> npt.NDArray[np.int32]:
+        """
+        Create the grid covering a geographic region.
+
+        Returns:
+            (N, 2) array of (lat, lon) grid indices; point (i, j) lies at
+            (i * resolution, j * resolution) degrees
+        """
+        lats = self._quantize(np.arange(south, north, self.resolution))
+        lons = self._quantize(np.arange(west, east, self.resolution))
+        # Broadcast the 1-D index views straight into the output instead of
+        # materializing two full 2-D grids and stacking them
+        lat_col, lon_row = np.meshgrid(lats, lons, indexing="ij", sparse=True)
+        grid_idx = np.empty((lats.size, lons.size, 2), dtype=np.int32)
+        grid_idx[..., 0] = lat_col
+        grid_idx[..., 1] = lon_row
+        return grid_idx.reshape(-1, 2)
+
+    def _quantize(self, degrees: npt.ArrayLike) -> npt.NDArray[np.int32]:
+        """Integer grid indices round(degrees / resolution), as ElevationGrid uses."""
+        return np.rint(np.asarray(degrees) / self.resolution).astype(np.int32)
+
+    @staticmethod
+    def _write_array(cache: zipfile.ZipFile, name: str, array: npt.ArrayLike):
+        """Write one array into an open .npz archive, as np.savez would."""
+        with cache.open(f"{name}.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.asanyarray(array))
+
+    def _region_file(
+        self,
+        region: Tuple[str, float, float, float, float],
+        overlaps: List[Tuple[npt.NDArray[np.int32], npt.NDArray[np.int32]]],
+    ) -> str:
+        """
+        Path of the cache file for one region.
+
+        Named by a hash of the region, the resolution and the bounds of the
+        earlier regions that overlap it, which decide which of its points it
+        fetches. Any change to those gives the region a new file, so it is
+        fetched again.
+        """
+        key_data = [*region, self.resolution, [[*lo, *hi] for lo, hi in overlaps]]
+        key = hashlib.blake2b(
+            orjson.dumps(key_data, option=orjson.OPT_SERIALIZE_NUMPY)
+        ).hexdigest()[:16]
+        return os.path.join(self.REGION_CACHE_DIR, f"{key}.npz.zst")
+
+    def _save_region(
+        self,
+        region_file: str,
+        region_name: str,
+        grid_idx: npt.NDArray[np.int32],
+        elevations: npt.NDArray[np.float32],
+    ):
+        """Save one region's grid index and elevation columns to its cache file."""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer, lat_idx=grid_idx[:, 0], lon_idx=grid_idx[:, 1], elev=elevations
+        )
+        compressor = zstandard.ZstdCompressor(level=self.COMPRESSION_LEVEL, threads=-1)
+
+        # Written under a temporary name so an interrupted run never leaves a
+        # truncated file that would make the region look fetched
+        partial_file = f"{region_file}.partial"
+        with open(partial_file, "wb") as f:
+            f.write(compressor.compress(buffer.getbuffer()))
+        os.replace(partial_file, region_file)
+        print(f"  ✓ Completed {region_name} ({len(grid_idx):,} points)")
+
+    def _consolidate(self, region_files: List[str]) -> int:
+        """
+        Combine the region files into CACHE_FILE, the one file readers load.
+
+        Regions are copied one at a time into an uncompressed archive, which is
+        then compressed in one multi-threaded pass. Both are built under
+        temporary names so an interrupted run never leaves a truncated cache.
+        Region files not in region_files are deleted afterwards.
+
+        Returns:
+            int: Total number of points cached
+        """
+        archive_file = f"{self.CACHE_FILE}.npz.partial"
+        partial_file = f"{self.CACHE_FILE}.partial"
+        decompressor = zstandard.ZstdDecompressor()
+        cached = 0
+        with zipfile.ZipFile(archive_file, "w") as cache:
+            for region_idx, region_file in enumerate(region_files):
+                with open(region_file, "rb") as f:
+                    region_data = decompressor.decompress(f.read())
+                with np.load(io.BytesIO(region_data)) as region:
+                    for column in ("lat_idx", "lon_idx", "elev"):
+                        self._write_array(
+                            cache, f"{column}_{region_idx}", region[column]
+                        )
+                    cached += len(region["elev"])
+            self._write_array(cache, "num_regions", len(region_files))
+            self._write_array(cache, "res", self.resolution)
+
+        compressor = zstandard.ZstdCompressor(level=self.COMPRESSION_LEVEL, threads=-1)
+        with open(archive_file, "rb") as src, open(partial_file, "wb") as dst:
+            compressor.copy_stream(src, dst, size=os.path.getsize(archive_file))
+        os.remove(archive_file)
+        os.replace(partial_file, self.CACHE_FILE)
+
+        with open(self.MANIFEST_FILE, "wb") as f:
+            f.write(orjson.dumps(region_files, option=orjson.OPT_INDENT_2))
+
+        # Region files are named by hash, so changing REGIONS or the resolution
+        # would otherwise leave the old ones behind forever
+        keep = {os.path.basename(region_file) for region_file in region_files}
+        for name in os.listdir(self.REGION_CACHE_DIR):
+            if name.endswith(".npz.zst") and name not in keep:
+                os.remove(os.path.join(self.REGION_CACHE_DIR, name))
+        return cached
+
+    def _read_manifest(self) -> List[str]:
+        """Region files CACHE_FILE was last consolidated from, [] if unknown."""
+        if not os.path.exists(self.CACHE_FILE) or not os.path.exists(
+            self.MANIFEST_FILE
+        ):
+            return []
+        with open(self.MANIFEST_FILE, "rb") as f:
+            return orjson.loads(f.read())
 
     def prefetch_elevations(self):
-        """Prefetch elevation data for all regions and save to cache file."""
-        if os.path.exists(self.CACHE_FILE):
-            print(f"Cache file {self.CACHE_FILE} already exists. Skipping prefetch.")
-            return
+        """
+        Prefetch elevation data for all regions and save to cache file.
 
-        cache: Dict[str, float] = {}
+        Each region is cached in its own file under REGION_CACHE_DIR, so only
+        regions that are new or changed since the last run are fetched.
+        """
+        if os.path.exists(self.LEGACY_CACHE_FILE):
+            print(
+                f"Cache file {self.LEGACY_CACHE_FILE} already exists. "
+                "Skipping prefetch."
+            )
+            return
 
         print(f"Prefetching elevation data for {len(self.REGIONS)} regions...")
         print(f"Resolution: {self.resolution} degrees (~1km grid spacing)\n")
 
-        for region_idx, (region_name, south, north, west, east) in enumerate(
-            self.REGIONS
-        ):
-            print(f"[{region_idx + 1}/{len(self.REGIONS)}] Processing {region_name}...")
-            coords = self._create_region_grid(south, north, west, east)
-            print(f"  Grid size: {len(coords):,} points")
+        region_files = []
+        pending = []  # (name, region file, grid indices) of regions to fetch
+        covered = []  # (min, max) grid indices of each region so far
+        for region_idx, region in enumerate(self.REGIONS):
+            region_name, south, north, west, east = region
+            grid_idx = self._create_region_grid(south, north, west, east)
+            bounds_lo, bounds_hi = grid_idx.min(axis=0), grid_idx.max(axis=0)
+            overlaps = [
+                (lo, hi)
+                for lo, hi in covered
+                if np.all(lo <= bounds_hi) and np.all(hi >= bounds_lo)
+            ]
+            region_file = self._region_file(region, overlaps)
+            region_files.append(region_file)
 
-            elevations = self._get_elevations_batch(coords, region_name)
+            if os.path.exists(region_file):
+                status = "cached"
+            else:
+                # Overlapping regions share grid points; fetch each one only once
+                fetched = np.zeros(len(grid_idx), dtype=bool)
+                for lo, hi in overlaps:
+                    fetched |= np.all((grid_idx >= lo) & (grid_idx <= hi), axis=1)
+                if fetched.any():
+                    grid_idx = grid_idx[~fetched]
+                pending.append((region_name, region_file, grid_idx))
+                status = f"{len(grid_idx):,} points to fetch"
+            covered.append((bounds_lo, bounds_hi))
+            print(f"[{region_idx + 1}/{len(self.REGIONS)}] {region_name}: {status}")
 
-            print(f"  Caching {len(coords):,} points...")
-            for (lat, lon), elev in zip(coords, elevations):
-                key = f"{lat:.6f},{lon:.6f}"
-                cache[key] = elev
+        if not pending and self._read_manifest() == region_files:
+            print(f"\nCache file {self.CACHE_FILE} is up to date. Skipping prefetch.")
+            return
 
+        os.makedirs(self.REGION_CACHE_DIR, exist_ok=True)
+        if not pending:
+            print("\nAll regions cached, rebuilding the combined cache...")
+        elif rasterio is not None and os.path.exists(self.RASTER_FILE):
+            print(f"\nReading {len(pending)} regions from {self.RASTER_FILE}...")
+            self._prefetch_regions_local(pending)
+        else:
             print(
-                f"  ✓ Completed {region_name} (Total cached: {len(cache):,} points)\n"
+                f"\nFetching {len(pending)} regions "
+                f"({self.MAX_CONCURRENT_REQUESTS} concurrent requests)..."
             )
+            asyncio.run(self._prefetch_regions_async(pending))
+
+        # Regions that failed to fetch are left out until a later run fetches them
+        saved_files = [f for f in region_files if os.path.exists(f)]
+        if len(saved_files) < len(region_files):
+            print(
+                f"\nWarning: {len(region_files) - len(saved_files)} regions failed "
+                "to fetch and will be fetched again on the next run"
+            )
+        if not saved_files:
+            print(f"No regions fetched, leaving {self.CACHE_FILE} unchanged")
+            return
 
-        print(f"Saving cache to {self.CACHE_FILE}...")
-        with open(self.CACHE_FILE, "w") as f:
-            json.dump(cache, f)
+        cached = self._consolidate(saved_files)
+        print(f"\nSaved cache to {self.CACHE_FILE}")
 
-        print(f"Done! Cached {len(cache)} elevation points across all regions")
+        print(f"Done! Cached {cached} elevation points across all regions")